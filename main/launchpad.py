@@ -1,5 +1,7 @@
 # I hate Python.
 
+from array import array
+from bisect import bisect_right
 from copy import copy
 from mididings import *
 import mididings.event as mididings_event
@@ -191,6 +193,11 @@ class Window:
     def process(this, event):
         return []
 
+    # Called when window stops being displayed (eg. by WindowSwitcher).
+    # Buttons held at that moment won't get their RELEASE events.
+    def hide(this):
+        pass
+
     # type can be Launchpad.PRESS or Launchpad.RELEASE.
     def ctrl_button_event(this, x, type):
         return []
@@ -252,6 +259,8 @@ class WindowSwitcher(Window):
 
     def draw_window(this):
         window = this.current_window()
+        # Windows may change their allocated buttons at any time:
+        this.update_allocated_buttons()
         for x in window.allocated_ctrl_buttons:
             this.ctrl_state[x] = window.ctrl_state[x]
         for y in window.allocated_page_buttons:
@@ -264,38 +273,122 @@ class WindowSwitcher(Window):
             this.page_state[this.scroll_page_button] = GREEN3 + RED3 if this.scroll_pressed else LED_OFF
 
     def set_current_window_index(this, index):
+        if index != this.current_window_index:
+            this.current_window().hide()
         this.current_window_index = index
+        this.draw_window()
+
+    def update_allocated_buttons(this):
         this.allocated_ctrl_buttons = copy(this.current_window().allocated_ctrl_buttons)
         this.allocated_page_buttons = copy(this.current_window().allocated_page_buttons)
         this.allocated_page_buttons.append(this.scroll_page_button)
-        this.draw_window()
 
     def current_window(this):
         return this.windows[this.current_window_index]
 
 class ChannelRouter(Window):
-    NOTE_PRESSED = 'pressed'
-    NOTE_SUSTAINED = 'sustained'
+    NOTE_RANGE = range(0, 128)
+    # Events of these types are sent to every channel of the zones:
+    CHANNEL_TYPES = (CTRL, PROGRAM, PITCHBEND, AFTERTOUCH, POLY_AFTERTOUCH)
     LIGHT_UP_ACTIVE_COLOR = GREEN3 + RED3
     LIGHT_UP_INACTIVE_COLOR = GREEN3 + RED1
     LIGHT_UP_TIME = 3
+    PAGE_ACTIVE_COLOR = GREEN3
+    PAGE_INACTIVE_COLOR = RED1
+
+    # Keyboard zone: notes from note_range with velocities from velocity_range
+    # are sent to all of the channels. Ranges are (low, high) tuples, inclusive.
+    # Zones may overlap (layers).
+    class Zone:
+        def __init__(this, note_range=(0, 127), velocity_range=(0, 127), channels=(1,)):
+            this.note_range = note_range
+            this.velocity_range = velocity_range
+            this.channels = list(channels)
 
     def __init__(this, rect, input_port, input_channel, output_port, active_color=RED3, inactive_color_odd=GREEN1, inactive_color_even=GREEN1):
         Window.__init__(this, rect)
         this.input_port = mididings_util.port_number(input_port)
         this.output_port = mididings_util.port_number(output_port)
         this.input_channel = input_channel
-        this.selected_channel = 1
+        # By default there's one zone spanning the whole keyboard:
+        this.zones = [this.Zone()]
+        this.current_zone_index = 0
+        this.zone_page_buttons = []
         this.highlighted_channels = {channel: 0 for channel in range(1, 17)}
-        # Note-on events are stored per channel, and if selected channel changes and note-offs are sent,
-        # they are also sent to the already sounding notes.
-        this.noteons = {channel: {} for channel in range(1, 17)}
+        # Channels to which each currently sounding note was sent, indexed by note number.
+        # Note-offs go to these channels, even if zones have changed in the meantime.
+        this.sounding_notes = [None for note in this.NOTE_RANGE]
         this.sustains = {channel: 0 for channel in range(1, 17)}
+        # Channels of matrix buttons that are currently held:
+        this.pressed_channels = []
         this.active_color = active_color
         this.inactive_color_odd = inactive_color_odd
         this.inactive_color_even = inactive_color_even
+        this.compile_zones()
+        this.update_colors()
+
+    # Replace zones with given list of ChannelRouter.Zone objects.
+    # Zones are copied, so editing them on the matrix doesn't modify the given objects.
+    # Empty list means the default zone spanning the whole keyboard.
+    def set_zones(this, zones):
+        this.zones = [this.Zone(zone.note_range, zone.velocity_range, zone.channels) for zone in zones] or [this.Zone()]
+        this.current_zone_index = 0
+        this.compile_zones()
+        this.update_colors()
+
+    # Page buttons used to select zone edited on the matrix. N-th button selects N-th zone.
+    def set_zone_page_buttons(this, buttons):
+        this.zone_page_buttons = buttons
+        this.allocated_page_buttons = buttons
         this.update_colors()
 
+    # Compile zones into note_table indexed by note number. Each entry is a pair
+    # (breakpoints, channel tuples), where breakpoints are sorted velocities at
+    # which the next channel tuple starts (empty if zones don't split the note
+    # by velocity). Identical channel tuples are shared.
+    def compile_zones(this):
+        tuples = {}
+        note_table = []
+        note_off_table = []
+        for note in this.NOTE_RANGE:
+            zones = [zone for zone in this.zones if zone.note_range[0] <= note <= zone.note_range[1]]
+            breakpoints = set()
+            for zone in zones:
+                low, high = zone.velocity_range
+                if low > 0:
+                    breakpoints.add(low)
+                if high < 127:
+                    breakpoints.add(high + 1)
+            breakpoints = tuple(sorted(breakpoints))
+            channel_tuples = []
+            for velocity in (0,) + breakpoints:
+                channels = []
+                for zone in zones:
+                    if zone.velocity_range[0] <= velocity <= zone.velocity_range[1]:
+                        for channel in zone.channels:
+                            if channel not in channels:
+                                channels.append(channel)
+                channels = tuple(channels)
+                channel_tuples.append(tuples.setdefault(channels, channels))
+            note_table.append((breakpoints, tuple(channel_tuples)))
+            all_channels = []
+            for zone in zones:
+                for channel in zone.channels:
+                    if channel not in all_channels:
+                        all_channels.append(channel)
+            all_channels = tuple(all_channels)
+            note_off_table.append(tuples.setdefault(all_channels, all_channels))
+        this.note_table = note_table
+        # Used for note-offs of notes that weren't tracked (eg. pressed before startup):
+        this.note_off_table = note_off_table
+        # Non-note events go to all channels used by zones:
+        channels = []
+        for zone in this.zones:
+            for channel in zone.channels:
+                if channel not in channels:
+                    channels.append(channel)
+        this.zone_channels = tuple(channels)
+
     def process(this, event):
         events = []
         if event.port == this.input_port:
@@ -303,17 +396,14 @@ class ChannelRouter(Window):
                 print event
             # Route data from configured input channel:
             if event.channel == this.input_channel:
-                events += this.track_notes(event)
-                event.port = this.output_port
-                event.channel = this.selected_channel
-                events.append(event)
+                events += this.route(event)
             # Route all events on channels other than configured back to the synth:
             elif event.type != SYSRT_CLOCK: # TODO enableable with a CTRL button
                 event.port = this.output_port
                 events.append(event)
-            # Blink a button on Note-on events:
-            if event.type == NOTEON:
-                this.highlighted_channels[event.channel] = this.LIGHT_UP_TIME
+                # Blink a button on Note-on events:
+                if event.type == NOTEON:
+                    this.highlighted_channels[event.channel] = this.LIGHT_UP_TIME
         if event.type == SYSRT_CLOCK:
             for i in range(1, 17):
                 if this.highlighted_channels[i] > 0:
@@ -321,42 +411,117 @@ class ChannelRouter(Window):
         this.update_colors()
         return events
 
-    def track_notes(this, event):
+    def route(this, event):
         events = []
         if event.type == NOTEON:
-            this.noteons[this.selected_channel][event.note] = this.NOTE_PRESSED
+            channels = this.note_channels(event.note, event.velocity)
+            this.sounding_notes[event.note] = channels
         elif event.type == NOTEOFF:
-            for channel, notes in this.noteons.iteritems():
-                if channel != this.selected_channel and notes.get(event.note) == this.NOTE_PRESSED:
-                    del notes[event.note]
-                    events.append(mididings_event.NoteOffEvent(this.output_port, channel, event.note))
-        elif event.type == CTRL and event.ctrl == CC_PEDAL:
-            this.sustains[this.selected_channel] = event.value
-            for channel, pedal_value in this.sustains.iteritems():
-                if channel != this.selected_channel and pedal_value > 0:
-                    this.sustains[channel] = event.value
-                    events.append(mididings_event.CtrlEvent(this.output_port, channel, CC_PEDAL, event.value))
+            channels = this.sounding_notes[event.note]
+            if channels is None:
+                channels = this.note_off_table[event.note]
+            this.sounding_notes[event.note] = None
+        elif event.type in this.CHANNEL_TYPES:
+            channels = this.zone_channels
+            if event.type == CTRL and event.ctrl == CC_PEDAL:
+                events += this.track_pedal(event)
+        # System events are passed once:
+        else:
+            event.port = this.output_port
+            return [event]
+        return events + this.send(event, channels)
+
+    # Return tuple of channels to which note-on should be sent.
+    def note_channels(this, note, velocity):
+        breakpoints, channel_tuples = this.note_table[note]
+        return channel_tuples[bisect_right(breakpoints, velocity)]
+
+    # Return copies of the event for each of the channels on the output port.
+    # Doesn't track notes; callers keep the channels of note-ons for their note-offs.
+    def send(this, event, channels):
+        events = []
+        for channel in channels:
+            events.append(this.routed_event(event, channel))
+            # Blink a button on Note-on events:
+            if event.type == NOTEON:
+                this.highlighted_channels[channel] = this.LIGHT_UP_TIME
+        return events
+
+    # Sustain pedal is also sent to channels which were sustained before zones
+    # changed, so that they get released.
+    def track_pedal(this, event):
+        events = []
+        for channel in this.zone_channels:
+            this.sustains[channel] = event.value
+        for channel, pedal_value in this.sustains.iteritems():
+            if channel not in this.zone_channels and pedal_value > 0:
+                this.sustains[channel] = event.value
+                events.append(mididings_event.CtrlEvent(this.output_port, channel, CC_PEDAL, event.value))
         return events
 
+    def routed_event(this, event, channel):
+        return mididings_event.MidiEvent(event.type, port=this.output_port, channel=channel, data1=event.data1, data2=event.data2)
+
+    def page_button_event(this, y, type):
+        if type == Launchpad.PRESS and y in this.zone_page_buttons:
+            index = this.zone_page_buttons.index(y)
+            if index < len(this.zones):
+                this.current_zone_index = index
+                this.update_colors()
+        return []
+
+    # Pressing a button assigns its channel to the current zone.
+    # Pressing more buttons while holding one adds/removes channels (layers).
     def matrix_button_event(this, x, y, type):
         events = []
+        channel = y * this.rect.w + x + 1
+        zone = this.current_zone()
         if type == Launchpad.PRESS:
-            pedal_value = this.sustains[this.selected_channel]
-            this.selected_channel = y * this.rect.w + x + 1
-            # If pedal was depressed before switching, transfer its CC value to
-            # the new channel:
-            if pedal_value > 0:
-                this.sustains[this.selected_channel] = pedal_value
-                events.append(mididings_event.CtrlEvent(this.output_port, this.selected_channel, CC_PEDAL, pedal_value))
-            print "ChannelRouter: switched to channel %d" % this.selected_channel
+            if this.pressed_channels:
+                if channel not in zone.channels:
+                    zone.channels.append(channel)
+                elif len(zone.channels) > 1:
+                    zone.channels.remove(channel)
+            else:
+                zone.channels = [channel]
+            this.pressed_channels.append(channel)
+            events += this.update_zones()
+            print "ChannelRouter: zone %d switched to channels %s" % (this.current_zone_index, zone.channels)
             this.update_colors()
+        elif type == Launchpad.RELEASE and channel in this.pressed_channels:
+            this.pressed_channels.remove(channel)
         return events
 
+    def update_zones(this):
+        events = []
+        previous_channels = this.zone_channels
+        pedal_value = max([this.sustains[channel] for channel in previous_channels] + [0])
+        this.compile_zones()
+        # If pedal was depressed before switching, transfer its CC value to
+        # the new channels:
+        if pedal_value > 0:
+            for channel in this.zone_channels:
+                if channel not in previous_channels:
+                    this.sustains[channel] = pedal_value
+                    events.append(mididings_event.CtrlEvent(this.output_port, channel, CC_PEDAL, pedal_value))
+        return events
+
+    def hide(this):
+        this.pressed_channels = []
+
+    def current_zone(this):
+        return this.zones[this.current_zone_index]
+
     def update_colors(this):
+        # Page buttons:
+        for i, y in enumerate(this.zone_page_buttons):
+            this.page_state[y] = this.PAGE_ACTIVE_COLOR if i == this.current_zone_index else this.PAGE_INACTIVE_COLOR
+        # Matrix:
+        channels = this.current_zone().channels
         for y in this.range_y:
             for x in this.range_x:
                 channel = y * this.rect.w + x + 1
-                active = channel == this.selected_channel
+                active = channel in channels
                 color = this.active_color if active else this.color_for_x(x, y)
                 if this.highlighted_channels[channel] > 0:
                     color = this.LIGHT_UP_ACTIVE_COLOR if active else this.LIGHT_UP_INACTIVE_COLOR
@@ -628,3 +793,284 @@ class PatternTrigger(Window):
     def active_color_for_matrix(this, x, y, brightness=2):
         return this.color_tables[brightness][(y * this.rect.w + x) % len(this.color_tables[brightness])]
 
+class Looper(Window):
+    TICKS_PER_BAR = 96
+    EMPTY = 'empty'
+    ARMED = 'armed'
+    RECORDING = 'recording'
+    PLAYING = 'playing'
+    MUTED = 'muted'
+    # Event types that are recorded. Index in this tuple is stored in packed events:
+    RECORDED_TYPES = (NOTEON, NOTEOFF, CTRL, PITCHBEND, AFTERTOUCH, POLY_AFTERTOUCH)
+    # Pitchbend values are signed:
+    DATA2_OFFSET = 8192
+    ARMED_BLINK_TIME = 24
+    LENGTH_ACTIVE_COLOR = GREEN3
+    LENGTH_INACTIVE_COLOR = RED1
+    POSITION_COLOR = GREEN3 + RED3
+    PAGE_CURRENT_COLOR = GREEN1 + RED1
+
+    # One loop slot. Events are packed into ints (see pack_event()) and stored
+    # in one array sorted by tick; offsets[tick]:offsets[tick + 1] is the range of events
+    # to be played at given tick, so playback doesn't need to search for anything.
+    class Loop:
+        def __init__(this, length_bars):
+            this.length_bars = length_bars
+            this.state = Looper.EMPTY
+            this.length = 0
+            this.offsets = array('L')
+            this.events = array('L')
+            # Unsorted events being recorded:
+            this.recorded_ticks = array('L')
+            this.recorded_events = array('L')
+            this.held_notes = [False for note in range(0, 128)]
+            # Channels to which notes were sent by playback, indexed by note number.
+            # Kept separately from the router's live notes:
+            this.sounding_notes = [None for note in range(0, 128)]
+
+        def has_loop(this):
+            return this.length > 0
+
+        def start_recording(this):
+            this.recorded_ticks = array('L')
+            this.recorded_events = array('L')
+            this.held_notes = [False for note in range(0, 128)]
+            this.recording_length = this.length_bars * Looper.TICKS_PER_BAR
+            this.state = Looper.RECORDING
+
+        def record(this, tick, event):
+            if event.type == NOTEON:
+                this.held_notes[event.note] = True
+            elif event.type == NOTEOFF:
+                # Skip note-offs of notes pressed before recording started:
+                if not this.held_notes[event.note]:
+                    return
+                this.held_notes[event.note] = False
+            this.recorded_ticks.append(tick % this.recording_length)
+            this.recorded_events.append(Looper.pack_event(event.type, event.data1, event.data2))
+
+        # Sort recorded events by tick (counting sort) into offsets/events arrays.
+        def finish_recording(this):
+            length = this.recording_length
+            # Release notes still held at the end of the loop:
+            for note in range(0, 128):
+                if this.held_notes[note]:
+                    this.recorded_ticks.append(length - 1)
+                    this.recorded_events.append(Looper.pack_event(NOTEOFF, note, 0))
+            offsets = array('L', [0]) * (length + 1)
+            for tick in this.recorded_ticks:
+                offsets[tick + 1] += 1
+            for tick in range(0, length):
+                offsets[tick + 1] += offsets[tick]
+            positions = array('L', offsets)
+            events = array('L', [0]) * len(this.recorded_events)
+            for tick, packed in zip(this.recorded_ticks, this.recorded_events):
+                events[positions[tick]] = packed
+                positions[tick] += 1
+            this.length = length
+            this.offsets = offsets
+            this.events = events
+            this.recorded_ticks = array('L')
+            this.recorded_events = array('L')
+            this.state = Looper.PLAYING
+
+        # Drop events being recorded and go back to the previous loop, if any.
+        def cancel_recording(this):
+            this.recorded_ticks = array('L')
+            this.recorded_events = array('L')
+            this.state = Looper.PLAYING if this.has_loop() else Looper.EMPTY
+
+        def clear(this):
+            this.state = Looper.EMPTY
+            this.length = 0
+            this.offsets = array('L')
+            this.events = array('L')
+
+        # Return packed events due at given tick.
+        def events_at(this, tick):
+            position = tick % this.length
+            return this.events[this.offsets[position]:this.offsets[position + 1]]
+
+    # Recorded events are played through the router, so they use its zones and
+    # output port/channels, just like live input.
+    # Only clock events from clock_input_port are counted.
+    def __init__(this, rect, router, clock_input_port):
+        Window.__init__(this, rect)
+        this.router = router
+        this.clock_input_port = mididings_util.port_number(clock_input_port)
+        this.tick = -1
+        this.loops = [this.Loop(1) for p in PAGE_RANGE]
+        this.current_loop_index = 0
+        this.armed_blink_counter = 0
+        this.record_button_pos = None
+        this.mute_button_pos = None
+        this.clear_button_pos = None
+        this.update_colors()
+
+    def set_record_button(this, button_pos):
+        this.record_button_pos = button_pos
+        this.update_ctrl_buttons()
+
+    def set_mute_button(this, button_pos):
+        this.mute_button_pos = button_pos
+        this.update_ctrl_buttons()
+
+    def set_clear_button(this, button_pos):
+        this.clear_button_pos = button_pos
+        this.update_ctrl_buttons()
+
+    def set_page_buttons(this, buttons):
+        this.allocated_page_buttons = buttons
+        this.update_colors()
+
+    @staticmethod
+    def pack_event(type, data1, data2):
+        return (Looper.RECORDED_TYPES.index(type) << 24) | (data1 << 16) | (data2 + Looper.DATA2_OFFSET)
+
+    def unpack_event(this, packed):
+        return mididings_event.MidiEvent(this.RECORDED_TYPES[packed >> 24],
+                                         port=this.router.input_port,
+                                         channel=this.router.input_channel,
+                                         data1=(packed >> 16) & 0xff,
+                                         data2=(packed & 0xffff) - this.DATA2_OFFSET)
+
+    def process(this, event):
+        events = []
+        if event.type == SYSRT_CLOCK:
+            if event.port == this.clock_input_port:
+                this.tick += 1
+                this.armed_blink_counter = (this.armed_blink_counter + 1) % this.ARMED_BLINK_TIME
+                for loop in this.loops:
+                    events += this.play(loop)
+                this.update_colors()
+        elif event.type == SYSRT_START:
+            if event.port == this.clock_input_port:
+                this.tick = -1
+        elif event.port == this.router.input_port and event.channel == this.router.input_channel and event.type in this.RECORDED_TYPES:
+            for loop in this.loops:
+                if loop.state == this.RECORDING:
+                    loop.record(this.tick, event)
+        return events
+
+    def play(this, loop):
+        events = []
+        if loop.state == this.ARMED:
+            if this.tick % (loop.length_bars * this.TICKS_PER_BAR) == 0:
+                events += this.release_notes(loop)
+                loop.start_recording()
+        elif loop.state == this.RECORDING:
+            if this.tick % loop.recording_length == 0:
+                loop.finish_recording()
+        if loop.state == this.PLAYING:
+            for packed in loop.events_at(this.tick):
+                event = this.unpack_event(packed)
+                if event.type == NOTEON:
+                    channels = this.router.note_channels(event.note, event.velocity)
+                    loop.sounding_notes[event.note] = channels
+                    events += this.router.send(event, channels)
+                elif event.type == NOTEOFF:
+                    channels = loop.sounding_notes[event.note]
+                    if channels is not None:
+                        loop.sounding_notes[event.note] = None
+                        events += this.router.send(event, channels)
+                else:
+                    events += this.router.route(event)
+        return events
+
+    def release_notes(this, loop):
+        events = []
+        for note in range(0, 128):
+            channels = loop.sounding_notes[note]
+            if channels is not None:
+                loop.sounding_notes[note] = None
+                events += this.router.send(this.unpack_event(this.pack_event(NOTEOFF, note, 0)), channels)
+        return events
+
+    def ctrl_button_event(this, x, type):
+        events = []
+        loop = this.current_loop()
+        if type == Launchpad.PRESS:
+            if this.record_button_pos != None and x == this.record_button_pos:
+                if loop.state == this.ARMED:
+                    loop.state = this.PLAYING if loop.has_loop() else this.EMPTY
+                elif loop.state == this.RECORDING:
+                    loop.cancel_recording()
+                else:
+                    if loop.state == this.PLAYING:
+                        events += this.release_notes(loop)
+                    loop.state = this.ARMED
+            if this.mute_button_pos != None and x == this.mute_button_pos:
+                if loop.state == this.PLAYING:
+                    events += this.release_notes(loop)
+                    loop.state = this.MUTED
+                elif loop.state == this.MUTED:
+                    loop.state = this.PLAYING
+            if this.clear_button_pos != None and x == this.clear_button_pos:
+                events += this.release_notes(loop)
+                loop.clear()
+            this.update_colors()
+        return events
+
+    def page_button_event(this, y, type):
+        if type == Launchpad.PRESS and y in this.allocated_page_buttons:
+            this.current_loop_index = y
+            this.update_colors()
+        return []
+
+    # Select length (in bars) of the next recording in current slot.
+    def matrix_button_event(this, x, y, type):
+        if type == Launchpad.PRESS:
+            loop = this.current_loop()
+            if loop.state != this.RECORDING:
+                loop.length_bars = y * this.rect.w + x + 1
+                this.update_colors()
+        return []
+
+    def update_ctrl_buttons(this):
+        this.allocated_ctrl_buttons = [
+            this.record_button_pos,
+            this.mute_button_pos,
+            this.clear_button_pos,
+        ]
+
+    def current_loop(this):
+        return this.loops[this.current_loop_index]
+
+    def color_for_state(this, state):
+        if state == this.ARMED:
+            return RED3 if this.armed_blink_counter > this.ARMED_BLINK_TIME / 2 else LED_OFF
+        elif state == this.RECORDING:
+            return RED3
+        elif state == this.PLAYING:
+            return GREEN3
+        elif state == this.MUTED:
+            return GREEN1
+        return LED_OFF
+
+    def update_colors(this):
+        loop = this.current_loop()
+        # Ctrl buttons:
+        if this.record_button_pos != None:
+            this.ctrl_state[this.record_button_pos] = this.color_for_state(loop.state) if loop.state in (this.ARMED, this.RECORDING) else RED1
+        if this.mute_button_pos != None:
+            this.ctrl_state[this.mute_button_pos] = this.color_for_state(loop.state) if loop.state in (this.PLAYING, this.MUTED) else LED_OFF
+        if this.clear_button_pos != None:
+            this.ctrl_state[this.clear_button_pos] = RED1 + GREEN1 if loop.has_loop() else LED_OFF
+        # Page buttons:
+        for y in this.allocated_page_buttons:
+            this.page_state[y] = this.color_for_state(this.loops[y].state)
+        if loop.state == this.EMPTY and this.current_loop_index in this.allocated_page_buttons:
+            this.page_state[this.current_loop_index] = this.PAGE_CURRENT_COLOR
+        # Matrix:
+        position_bar = None
+        if loop.state == this.RECORDING:
+            position_bar = (this.tick % loop.recording_length) / this.TICKS_PER_BAR
+        elif loop.state == this.PLAYING:
+            position_bar = (this.tick % loop.length) / this.TICKS_PER_BAR
+        for y in this.range_y:
+            for x in this.range_x:
+                bar = y * this.rect.w + x
+                color = this.LENGTH_ACTIVE_COLOR if bar + 1 == loop.length_bars else this.LENGTH_INACTIVE_COLOR
+                if bar == position_bar:
+                    color = this.POSITION_COLOR
+                this.matrix_state[x][y] = color